@@ -2,38 +2,35 @@
 import pandas as pd
 from typing import Any
 import numpy as np
-import json
+import orjson
 import sys
 from pathlib import Path
+import jmespath
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import BulkIndexError, parallel_bulk
 from procrustus_indexer import build_indexer
-import glob
 
 es = Elasticsearch(
     hosts=["http://localhost:9200"]
 )
 
-def sanitize(value: Any) -> Any:
-    try:
-        if pd.isna(value):
-            return None
-    except Exception:
-        pass
-
-    if isinstance(value, (pd.Timestamp, pd.NaT.__class__)):
-        return None if pd.isna(value) else value.isoformat()
-
+# parallel_bulk tuning. BULK_CHUNK_SIZE = 1000 is a conservative default, not derived from
+# document sizes; BULK_MAX_CHUNK_BYTES caps each request regardless.
+BULK_THREAD_COUNT = 8
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+BULK_QUEUE_SIZE = 4
+POST_IMPORT_REFRESH_INTERVAL = "30s"
+
+def json_default(value: Any) -> Any:
+    # orjson handles NaN and NumPy natively; only pandas' missing values and timestamps need help
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
     if isinstance(value, np.generic):
         return value.item()
-
-    # Recurse
-    if isinstance(value, dict):
-        return {k: sanitize(v) for k, v in value.items()}
-    if isinstance(value, (list, tuple)):
-        t = [sanitize(v) for v in value]
-        return t if isinstance(value, list) else tuple(t)
-
-    return value
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
 
 def excel_to_json(excel_path: str, sheet_name: str):
     df = pd.read_excel(
@@ -43,8 +40,6 @@ def excel_to_json(excel_path: str, sheet_name: str):
         dtype_backend="numpy_nullable",
     )
 
-    df = df.astype(object).where(~df.isna(), None)
-
     df.insert(0, "rowId", range(1, len(df) + 1))
 
     records = df.to_dict(orient="records")
@@ -56,28 +51,93 @@ def excel_to_json(excel_path: str, sheet_name: str):
 
     # Zero-padding width for nicer sorting (e.g., 00001)
     pad = max(5, len(str(len(records))))
+    # Filename template <base>-<rowId>.json, built once; rowId is always an int from range() above
+    name_fmt = f"{base.replace('%', '%%')}-%0{pad}d.json"
 
     # Write one JSON per row
     written = 0
     for rec in records:
-        clean = sanitize(rec)
-
-        # Choose filename: <base>-<rowId>.json (zero-padded)
-        row_id = clean.get("rowId", written + 1)
-        file_name = out_dir / f"{base}-{int(row_id):0{pad}d}.json"
+        file_name = out_dir / (name_fmt % rec["rowId"])
 
-        with open(file_name, "w", encoding="utf-8") as f:
-            json.dump(clean, f, ensure_ascii=False, indent=2, allow_nan=False)
+        file_name.write_bytes(orjson.dumps(
+            rec,
+            default=json_default,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        ))
         written += 1
 
     print(f"Wrote {written} row files to: {out_dir}/, base: '{base}'")
-
-def import_index(sheet: str, es: Elasticsearch):
-    indexer = build_indexer(f"indexer-{sheet.lower()}-config.toml", sheet.lower(), es)
+    return records
+
+def compile_index_paths(index_cfg: dict, cfg: str):
+    # Compile the 'jmes:' id and facet paths of the parsed indexer config ([index] table)
+    def compile_path(path: str):
+        if not path.startswith("jmes:"):
+            raise ValueError(f"Unsupported path in {cfg}: {path!r} (only 'jmes:' paths are supported)")
+        return jmespath.compile(path[len("jmes:"):])
+
+    id_expr = compile_path(index_cfg["id"]["path"])
+    facet_exprs = {name: compile_path(facet["path"]) for name, facet in index_cfg.get("facet", {}).items()}
+    return id_expr, facet_exprs
+
+def bulk_actions(index_name: str, records: list, id_expr, facet_exprs: dict):
+    # Map each record onto the id and facets of the indexer config, like the indexer does per JSON file:
+    # round-trip through orjson first so the expressions see JSON values (pd.NA -> None, no NumPy types).
+    # No _id: the index is recreated on every import, so let ES assign IDs (no version lookup per doc)
+    for rec in records:
+        rec = orjson.loads(orjson.dumps(rec, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY))
+        doc = {"id": id_expr.search(rec)}
+        for name, expr in facet_exprs.items():
+            doc[name] = expr.search(rec)
+        yield {"_index": index_name, "_source": doc}
+
+def import_index(sheet: str, es: Elasticsearch, records: list):
+    cfg = f"indexer-{sheet.lower()}-config.toml"
+    indexer = build_indexer(cfg, sheet.lower(), es)
     indexer.create_mapping(overwrite=True)
-    input_list = glob.glob(f"json-files-resolved/{sheet.lower()}-*.json")
-    indexer.import_files(input_list)
-    print(f"Imported {len(input_list)} files into Elastic Search, index '{sheet.lower()}'")
+    id_expr, facet_exprs = compile_index_paths(indexer.config["index"], cfg)
+    # No refresh, replicas or per-request translog fsync while loading; restored (and merged) afterwards.
+    # A crash mid-import can lose the last unsynced writes, in which case just re-run the import.
+    current = es.indices.get_settings(index=sheet.lower(), name="index.number_of_replicas")
+    replicas = current[sheet.lower()]["settings"]["index"]["number_of_replicas"]
+    es.indices.put_settings(index=sheet.lower(), settings={"index": {
+        "refresh_interval": "-1",
+        "number_of_replicas": 0,
+        "translog": {"durability": "async", "sync_interval": "30s"},
+    }})
+    imported = 0
+    failed = []
+    try:
+        for ok, info in parallel_bulk(
+                es,
+                bulk_actions(sheet.lower(), records, id_expr, facet_exprs),
+                thread_count=BULK_THREAD_COUNT,
+                chunk_size=BULK_CHUNK_SIZE,
+                max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                queue_size=BULK_QUEUE_SIZE,
+                raise_on_error=False,
+        ):
+            if ok:
+                imported += 1
+            else:
+                failed.append(info)
+                print(f"Failed to index document: {info}")
+        # Raised inside the try so the settings are restored first; a partial index is a failure
+        if failed:
+            raise BulkIndexError(f"{len(failed)} document(s) failed to index into '{sheet.lower()}'", failed)
+    finally:
+        es.indices.put_settings(
+            index=sheet.lower(),
+            settings={"index": {
+                "refresh_interval": POST_IMPORT_REFRESH_INTERVAL,
+                "number_of_replicas": replicas,
+                "translog": {"durability": "request"},
+            }},
+        )
+    # Merge and refresh only after a successful load, so they can't mask a bulk error
+    es.indices.forcemerge(index=sheet.lower(), max_num_segments=1)
+    es.indices.refresh(index=sheet.lower())
+    print(f"Imported {imported} records into Elastic Search, index '{sheet.lower()}'")
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -86,7 +146,7 @@ if __name__ == "__main__":
         # Create JSON files from the input Excel file
         excel_file = sys.argv[1]
         sheet = sys.argv[2] if len(sys.argv) > 2 else None
-        excel_to_json(excel_file, sheet_name=sheet)
+        records = excel_to_json(excel_file, sheet_name=sheet)
 
         # Import the ES indexes
-        import_index(sheet, es)
+        import_index(sheet, es, records)
@@ -4,32 +4,35 @@ read_and_index.py
 
 Features
 - Process one, many (comma-separated), or ALL sheets from an Excel file.
-- Control processing order via SHEET_ORDER (later sheets can reuse earlier results).
+- Process sheets in dependency order derived from RELATIONS (later sheets reuse earlier results).
 - Denormalize ("blow up") foreign keys from other sheets into embedded objects/arrays.
 - Keep processed rows in memory and reuse them for downstream sheets (prefer processed).
-- Write one JSON file per row (<sheet>-00001.json, ...).
+- Import each processed sheet into Elasticsearch straight from memory if an indexer config exists.
+- Optional: write one JSON file per row (<sheet>-00001.json, ...) for debugging (--write-files).
 - Optional: write one combined JSON for a single sheet after all processing (--single-out=Sheet).
-- Import each processed sheet into Elasticsearch if an indexer config exists.
 
 Usage
-  python read_and_index.py <excel_file> [sheet_name|A,B,C|ALL] [--single-out=SheetName]
+  python read_and_index.py <excel_file> [sheet_name|A,B,C|ALL] [--single-out=SheetName] [--write-files]
 
 Examples
   python read_and_index.py data.xlsx ALL
   python read_and_index.py data.xlsx Tijdschriften,Personen --single-out=Tijdschriften
+  python read_and_index.py data.xlsx Personen --write-files
 """
 
 import os
-import glob
-import json
 import sys
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional, Set, DefaultDict
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+import jmespath
 import numpy as np
+import orjson
 import pandas as pd
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import BulkIndexError, parallel_bulk
 from procrustus_indexer import build_indexer
 
 # ============================ RELATIONS ============================
@@ -68,7 +71,8 @@ RELATIONS: Dict[str, List[Dict[str, Any]]] = {
 }
 
 # ============================ SHEET ORDER CONFIG ================================
-# Process in this order - any requested target sheets keep this relative order.
+# Process in this order - any requested target sheets keep this relative order
+# (a sheet is still moved after the sheets it references in RELATIONS).
 SHEET_ORDER = [
     "Plaatsnaam",
     "Personen",
@@ -77,38 +81,42 @@ SHEET_ORDER = [
 ]
 
 # ============================ OUTPUT CONFIG =====================================
-WRITE_ONE_FILE_PER_ROW = True
+# Per-row files are only a debugging aid (--write-files); ES is fed from memory.
+WRITE_ONE_FILE_PER_ROW = False
 OUT_DIR = Path("json-files-resolved")
+JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+# Threads writing per-row files; file writes release the GIL, so they overlap well.
+WRITE_WORKERS = 16
+
+# ============================ BULK IMPORT CONFIG ================================
+# parallel_bulk tuning. BULK_CHUNK_SIZE = 1000 is a conservative default, not derived from
+# document sizes; BULK_MAX_CHUNK_BYTES caps each request regardless.
+BULK_THREAD_COUNT = 8
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+BULK_QUEUE_SIZE = 4
+# Refresh interval applied once the import is done (refresh is disabled while loading).
+POST_IMPORT_REFRESH_INTERVAL = "30s"
+# Sheets imported concurrently in the background while later sheets are still being processed.
+IMPORT_WORKERS = 2
 
 es = Elasticsearch(hosts=["http://localhost:9200"])
 
-# ============================ SANITIZATION ================================
-def sanitize(value: Any) -> Any:
-    """Convert pandas/NumPy types to JSON-safe Python types; drop NaNs; recurse."""
-    try:
-        if pd.isna(value):
-            return None
-    except Exception:
-        pass
-
-    if isinstance(value, (pd.Timestamp, pd.NaT.__class__)):
-        return None if pd.isna(value) else value.isoformat()
-
+# ============================ SERIALIZATION ================================
+def _json_default(value: Any) -> Any:
+    """orjson fallback for the pandas/NumPy values it cannot encode natively."""
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
     if isinstance(value, np.generic):
         return value.item()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
 
-    if isinstance(value, dict):
-        return {k: sanitize(v) for k, v in value.items()}
-
-    if isinstance(value, (list, tuple)):
-        t = [sanitize(v) for v in value]
-        return t if isinstance(value, list) else tuple(t)
-
-    return value
+def _write_json(file_name: Path, rec: Dict[str, Any]) -> None:
+    file_name.write_bytes(orjson.dumps(rec, default=_json_default, option=JSON_OPTIONS))
 
 # ------------------------------ In-memory stores --------------------------------
-# Processed rows, by sheet (already-expanded, sanitized per row at write time).
-_PROCESSED_SHEETS: Dict[str, List[Dict[str, Any]]] = {}
 # Index from PROCESSED rows: (sheet, id_col) -> { id -> row_without_id }
 _PROCESSED_INDEX_CACHE: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
 # Raw ref index from Excel (fallback): (abs_excel_path, sheet, id_col) -> { id -> row_without_id }
@@ -125,42 +133,45 @@ def _infer_needed_indices_from_relations() -> DefaultDict[str, Set[str]]:
             need[rel["ref_sheet"]].add(rel["ref_id_col"])
     return need
 
-_NEEDED_INDICES = _infer_needed_indices_from_relations()
+# Frozen per sheet, sorted so id columns are always visited in the same order.
+_NEEDED_INDICES: Dict[str, Tuple[str, ...]] = {
+    sheet: tuple(sorted(id_cols)) for sheet, id_cols in _infer_needed_indices_from_relations().items()
+}
 
 # ------------------------------ Ref index builders ------------------------------
 
-def _rowdict_without_id(d: Dict[str, Any], id_col: str) -> Dict[str, Any]:
-    # drop id_col and empty-string fields for cleaner embedding
-    out = {k: v for k, v in d.items() if k != id_col and v != ""}
-    return out
-
-def build_processed_indices_for_sheet(sheet: str, records: List[Dict[str, Any]]) -> None:
+def build_processed_indices_for_sheet(sheet: str, df: pd.DataFrame) -> None:
     """
-    From processed records, build {id -> row_without_id} for each id_col that other sheets use
-    to reference this sheet (inferred from RELATIONS).
+    From the processed sheet, build {id -> row_without_id} for each id_col that other sheets use
+    to reference this sheet (inferred from RELATIONS). IDs are normalized column-wise and each
+    map comes from a single set_index/to_dict; empty-string fields are dropped for cleaner embedding.
     """
-    id_cols = _NEEDED_INDICES.get(sheet, set())
+    id_cols = _NEEDED_INDICES.get(sheet, ())
     if not id_cols:
         return
     for id_col in id_cols:
-        idx: Dict[str, Dict[str, Any]] = {}
-        for r in records:
-            raw_id = r.get(id_col)
-            if raw_id in (None, ""):
-                continue
-            key = str(raw_id).strip()
-            if not key:
-                continue
-            idx[key] = _rowdict_without_id(r, id_col)
-        _PROCESSED_INDEX_CACHE[(sheet, id_col)] = idx
-
-def load_raw_ref_index(xls_path: str, sheet: str, id_col: str) -> Dict[str, Dict[str, Any]]:
+        if id_col not in df.columns:
+            _PROCESSED_INDEX_CACHE[(sheet, id_col)] = {}
+            continue
+        keys = df[id_col].astype("string").str.strip()
+        keep = keys.notna() & (keys != "")
+        rows = df.loc[keep].drop(columns=[id_col])
+        rows.index = keys[keep]
+        # last row wins on duplicate IDs
+        rows = rows[~rows.index.duplicated(keep="last")]
+        # only drop empty strings; `v != ""` would be ambiguous for pd.NA
+        _PROCESSED_INDEX_CACHE[(sheet, id_col)] = {
+            key: {k: v for k, v in row.items() if not isinstance(v, str) or v}
+            for key, row in rows.to_dict(orient="index").items()
+        }
+
+def load_raw_ref_index(xls: pd.ExcelFile, sheet: str, id_col: str) -> Dict[str, Dict[str, Any]]:
     """Read a reference sheet from Excel and build a {id -> row-without-id} map. Cached."""
-    cache_key = (os.path.abspath(xls_path), sheet, id_col)
+    cache_key = (os.path.abspath(xls.io), sheet, id_col)
     if cache_key in _RAW_REF_INDEX_CACHE:
         return _RAW_REF_INDEX_CACHE[cache_key]
 
-    df = pd.read_excel(xls_path, sheet_name=sheet, dtype=str).fillna("")
+    df = pd.read_excel(xls, sheet_name=sheet, dtype=str).fillna("")
     if id_col not in df.columns:
         raise KeyError(f"Sheet '{sheet}' missing id column '{id_col}'")
 
@@ -177,7 +188,7 @@ def load_raw_ref_index(xls_path: str, sheet: str, id_col: str) -> Dict[str, Dict
     return idx
 
 def get_best_ref_index(
-        xls_path: str,
+        xls: pd.ExcelFile,
         ref_sheet: str,
         ref_id_col: str,
         prefer_processed: bool = True,
@@ -190,74 +201,85 @@ def get_best_ref_index(
         proc_key = (ref_sheet, ref_id_col)
         if proc_key in _PROCESSED_INDEX_CACHE:
             return _PROCESSED_INDEX_CACHE[proc_key]
-    return load_raw_ref_index(xls_path, ref_sheet, ref_id_col)
+    return load_raw_ref_index(xls, ref_sheet, ref_id_col)
 
 # ------------------------------ Blow-up relations -------------------------------
 
-def embed_relations_into_records(
-        xls_path: str,
+def embed_relations_into_frame(
+        xls: pd.ExcelFile,
         main_sheet: str,
-        records: List[Dict[str, Any]],
+        df: pd.DataFrame,
         relations: List[Dict[str, Any]],
         default_sep: str = SEP,
         prefer_processed_refs: bool = True,
-) -> None:
-    """Mutates `records` in place: replaces FK columns with embedded objects/arrays.
+) -> pd.DataFrame:
+    """Return `df` with FK columns replaced by embedded objects/arrays.
 
     For each relation, we resolve references via:
       1) processed in-memory indices (if available and prefer_processed_refs=True)
       2) otherwise cached raw ref indices from Excel.
+    Each ref index is turned into an {id -> embedded object} Series once, so resolving an
+    FK column is a single vectorized Series.map instead of a lookup per row.
     """
-    ref_indices: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
+    lookups: Dict[Tuple[str, str], pd.Series] = {}
     for rel in relations:
         key = (rel["ref_sheet"], rel["ref_id_col"])
-        if key not in ref_indices:
-            ref_indices[key] = get_best_ref_index(
-                xls_path=xls_path,
+        if key not in lookups:
+            ref_idx = get_best_ref_index(
+                xls=xls,
                 ref_sheet=rel["ref_sheet"],
                 ref_id_col=rel["ref_id_col"],
                 prefer_processed=prefer_processed_refs,
             )
+            lookups[key] = pd.Series({i: dict(id=i, **row) for i, row in ref_idx.items()}, dtype=object)
 
-    for row in records:
-        for rel in relations:
-            fk_col = rel["fk_col"]
-            out_key = rel["as"]
-            many = bool(rel.get("many", False))
-            drop_fk = bool(rel.get("drop_fk", True))
-            sep = rel.get("sep", default_sep)
+    # Normalize all FK columns in one go (string dtype, stripped, missing -> ""), leaving
+    # the original columns untouched for relations that keep them.
+    fk_cols = [c for c in dict.fromkeys(rel["fk_col"] for rel in relations) if c in df.columns]
+    fks = df[fk_cols].astype("string").apply(lambda col: col.str.strip()).fillna("")
 
-            raw_val = row.get(fk_col, "")
-            fk_val = str(raw_val).strip() if raw_val is not None else ""
+    drop_cols: List[str] = []
+    for rel in relations:
+        fk_col = rel["fk_col"]
+        out_key = rel["as"]
+        many = bool(rel.get("many", False))
+        sep = rel.get("sep", default_sep)
 
-            ref_idx = ref_indices[(rel["ref_sheet"], rel["ref_id_col"])]
+        if fk_col in fks.columns:
+            fk = fks[fk_col]
+        else:
+            fk = pd.Series("", index=df.index, dtype="string")
 
-            if many:
-                ids = [s.strip() for s in fk_val.split(sep) if s and s.strip()]
-                row[out_key] = [dict(id=i, **ref_idx[i]) for i in ids if i in ref_idx]
-            else:
-                row[out_key] = dict(id=fk_val, **ref_idx[fk_val]) if fk_val in ref_idx else None
+        lookup = lookups[(rel["ref_sheet"], rel["ref_id_col"])]
 
-            if drop_fk:
-                row.pop(fk_col, None)
+        if many:
+            ids = fk.str.split(sep).explode().str.strip()
+            ids = ids[ids != ""]
+            matched = ids.map(lookup).dropna()
+            by_row = matched.groupby(level=0).agg(list).to_dict()
+            df[out_key] = df.index.to_series().map(lambda i: by_row.get(i, []))
+        else:
+            embedded = fk.map(lookup)
+            df[out_key] = embedded.where(embedded.notna(), None)
+
+        if rel.get("drop_fk", True):
+            drop_cols.append(fk_col)
 
-        # prune empty-string fields for cleaner JSON
-        #for k in [k for k, v in row.items() if v == ""]:
-        #    row.pop(k, None)
+    return df.drop(columns=drop_cols, errors="ignore")
 
 # ------------------------------ Excel helpers ----------------------------------
 
-def _resolve_all_sheets(excel_path: str) -> List[str]:
-    return pd.ExcelFile(excel_path).sheet_names
+def _resolve_all_sheets(xls: pd.ExcelFile) -> List[str]:
+    return xls.sheet_names
 
-def _normalize_targets(excel_path: str, sheet_arg: Optional[str]) -> List[str]:
+def _normalize_targets(xls: pd.ExcelFile, sheet_arg: Optional[str]) -> List[str]:
     """Return target sheet names in ordered form.
     - None or 'ALL' → all sheets
     - 'A,B,C' → those sheets
     - single name → that sheet
     Order is by SHEET_ORDER first; extras go to the end alphabetically.
     """
-    all_sheets = _resolve_all_sheets(excel_path)
+    all_sheets = _resolve_all_sheets(xls)
 
     if sheet_arg is None or sheet_arg.strip().upper() == "ALL":
         selected = all_sheets
@@ -277,74 +299,127 @@ def _normalize_targets(excel_path: str, sheet_arg: Optional[str]) -> List[str]:
 # ------------------------------ Excel → JSON (per sheet) -----------------------
 
 def excel_sheet_to_json(
-        excel_path: str,
+        xls: pd.ExcelFile,
         main_sheet: str,
         prefer_processed_refs: bool = True,
+        write_files: bool = WRITE_ONE_FILE_PER_ROW,
 ) -> Tuple[int, List[Dict[str, Any]]]:
-    """Process one sheet: blow up FKs (preferring processed refs), write per-row JSON files.
-    Returns (count written, cleaned_records_for_this_sheet).
+    """Process one sheet: blow up FKs (preferring processed refs), optionally write per-row JSON files.
+    Returns (count written, records_for_this_sheet).
     """
     df = pd.read_excel(
-        excel_path,
+        xls,
         sheet_name=main_sheet,
         keep_default_na=False,
         dtype_backend="numpy_nullable",
     )
-    df = df.astype(object).where(~df.isna(), None)
+    # Missing values stay pd.NA (numpy_nullable); they are written as null by _json_default
     df.insert(0, "rowId", range(1, len(df) + 1))
 
-    records = df.to_dict(orient="records")
-
     # Blow up relations for this sheet if configured
     if main_sheet in RELATIONS and RELATIONS[main_sheet]:
-        embed_relations_into_records(
-            xls_path=excel_path,
+        df = embed_relations_into_frame(
+            xls=xls,
             main_sheet=main_sheet,
-            records=records,
+            df=df,
             relations=RELATIONS[main_sheet],
             default_sep=SEP,
             prefer_processed_refs=prefer_processed_refs,
         )
 
-    # Keep processed (pre-sanitize) records in memory for downstream sheets
-    _PROCESSED_SHEETS[main_sheet] = [dict(r) for r in records]
-    # Build processed indices for any id_cols other sheets will use to reference this sheet
-    build_processed_indices_for_sheet(main_sheet, _PROCESSED_SHEETS[main_sheet])
+    records = df.to_dict(orient="records")
 
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
-    base = str(main_sheet).lower()
-    pad = max(5, len(str(len(records))))
+    # Build processed indices for any id_cols other sheets will use to reference this sheet
+    build_processed_indices_for_sheet(main_sheet, df)
 
     written = 0
-    cleaned_records: List[Dict[str, Any]] = []
 
-    for rec in records:
-        clean = sanitize(rec)
-        cleaned_records.append(clean)
+    if write_files:
+        OUT_DIR.mkdir(parents=True, exist_ok=True)
+        base = str(main_sheet).lower()
+        pad = max(5, len(str(len(records))))
+        # <base>-<rowId>.json, zero-padded; records are already in rowId order and rowId is an int
+        name_fmt = f"{base.replace('%', '%%')}-%0{pad}d.json"
+
+        with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+            futures = []
+            for rec in records:
+                file_name = OUT_DIR / (name_fmt % rec["rowId"])
+                futures.append(pool.submit(_write_json, file_name, rec))
+                written += 1
+            for future in futures:
+                future.result()
+        print(f"[{main_sheet}] Wrote {written} row files → {OUT_DIR}/ (base '{base}')")
 
-        if WRITE_ONE_FILE_PER_ROW:
-            row_id = clean.get("rowId", written + 1)
-            file_name = OUT_DIR / f"{base}-{int(row_id):0{pad}d}.json"
-            with open(file_name, "w", encoding="utf-8") as f:
-                json.dump(clean, f, ensure_ascii=False, indent=2, allow_nan=False)
-            written += 1
+    return written, records
 
-    if WRITE_ONE_FILE_PER_ROW:
-        print(f"[{main_sheet}] Wrote {written} row files → {OUT_DIR}/ (base '{base}')")
+# ------------------------------ Sheet ordering ----------------------------------
 
-    return written, cleaned_records
+def _dependency_order(targets: List[str]) -> List[str]:
+    """Order target sheets so every sheet comes after the target sheets it references (RELATIONS).
+
+    Otherwise the order of `targets` (i.e. SHEET_ORDER) is kept. References to non-target
+    sheets fall back to the raw Excel index and do not constrain the order.
+    """
+    target_set = set(targets)
+    ordered: List[str] = []
+
+    def visit(sheet: str, path: Tuple[str, ...] = ()) -> None:
+        if sheet in path:
+            raise ValueError(f"Cyclic RELATIONS between sheets: {' -> '.join(path + (sheet,))}")
+        if sheet in ordered:
+            return
+        for rel in RELATIONS.get(sheet, []):
+            if rel["ref_sheet"] in target_set and rel["ref_sheet"] != sheet:
+                visit(rel["ref_sheet"], path + (sheet,))
+        ordered.append(sheet)
+
+    for sheet in targets:
+        visit(sheet)
+    return ordered
 
 # ------------------------------ Elasticsearch import ---------------------------
 
-def import_index(sheet: str, es_client: Elasticsearch) -> None:
-    """Import JSON files for a sheet into Elasticsearch if config exists."""
+def _compile_index_paths(index_cfg: Dict[str, Any], cfg: str) -> Tuple[Any, Dict[str, Any]]:
+    """Compile the 'jmes:' id and facet paths of a parsed indexer config (its [index] table)."""
+    def compile_path(path: str) -> Any:
+        if not path.startswith("jmes:"):
+            raise ValueError(f"Unsupported path in {cfg}: {path!r} (only 'jmes:' paths are supported)")
+        return jmespath.compile(path[len("jmes:"):])
+
+    id_expr = compile_path(index_cfg["id"]["path"])
+    facet_exprs = {name: compile_path(facet["path"]) for name, facet in index_cfg.get("facet", {}).items()}
+    return id_expr, facet_exprs
+
+def _bulk_actions(
+        es_index_name: str,
+        records: List[Dict[str, Any]],
+        id_expr: Any,
+        facet_exprs: Dict[str, Any],
+):
+    """Yield one bulk 'index' action per record, mapped the same way the indexer maps a JSON file.
+
+    Each record is round-tripped through orjson first, so the JMESPath expressions see exactly
+    what the indexer would read from the file: pd.NA (also in embedded objects) becomes None,
+    timestamps become ISO strings and NumPy scalars become plain Python values.
+
+    No _id is sent: import_index always loads into a freshly created index, so ES can assign
+    its own IDs and skip the per-document version lookup. The row id stays in the 'id' field.
+    """
+    for rec in records:
+        rec = orjson.loads(orjson.dumps(rec, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY))
+        doc = {"id": id_expr.search(rec)}
+        for name, expr in facet_exprs.items():
+            doc[name] = expr.search(rec)
+        yield {"_index": es_index_name, "_source": doc}
+
+def import_index(sheet: str, es_client: Elasticsearch, records: List[Dict[str, Any]]) -> None:
+    """Bulk-import the in-memory records of a sheet into Elasticsearch if config exists."""
     es_index_name = f"hi-ga-tijdschriften-{sheet.lower()}"
     cfg = f"indexer-{sheet.lower()}-config.toml"
-    pattern = f"{OUT_DIR}/{sheet.lower()}-*.json"
 
-    inputs = glob.glob(pattern)
-    if not inputs:
-        print(f"[{sheet}] Skipping ES import: no JSON files found for pattern {pattern}")
+    if not records:
+        print(f"[{sheet}] Skipping ES import: no records")
         return
 
     if not Path(cfg).exists():
@@ -353,61 +428,122 @@ def import_index(sheet: str, es_client: Elasticsearch) -> None:
 
     indexer = build_indexer(cfg, es_index_name, es_client)
     indexer.create_mapping(overwrite=True)
-    indexer.import_files(inputs)
-    print(f"[{sheet}] Imported {len(inputs)} files into Elasticsearch index '{es_index_name}'")
+    # Compile the paths before touching index settings, so a bad config leaves them unchanged
+    id_expr, facet_exprs = _compile_index_paths(indexer.config["index"], cfg)
+
+    # Disable refresh and replication and fsync the translog on a timer instead of per
+    # bulk request while loading; all are restored once the import finishes, also when it
+    # fails. After a successful load the index is merged down to one segment.
+    # The async translog is only acceptable because this loader is re-runnable: if ES
+    # crashes mid-import, up to sync_interval of writes is lost and the sheet must be
+    # imported again.
+    current = es_client.indices.get_settings(index=es_index_name, name="index.number_of_replicas")
+    replicas = current[es_index_name]["settings"]["index"]["number_of_replicas"]
+    es_client.indices.put_settings(
+        index=es_index_name,
+        settings={"index": {
+            "refresh_interval": "-1",
+            "number_of_replicas": 0,
+            "translog": {"durability": "async", "sync_interval": "30s"},
+        }},
+    )
+
+    imported = 0
+    failed: List[Dict[str, Any]] = []
+    try:
+        for ok, info in parallel_bulk(
+                es_client,
+                _bulk_actions(es_index_name, records, id_expr, facet_exprs),
+                thread_count=BULK_THREAD_COUNT,
+                chunk_size=BULK_CHUNK_SIZE,
+                max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                queue_size=BULK_QUEUE_SIZE,
+                raise_on_error=False,
+        ):
+            if ok:
+                imported += 1
+            else:
+                failed.append(info)
+                print(f"[{sheet}] Failed to index document: {info}")
+        # Raised inside the try so the settings are restored first; a partial index is a failure
+        if failed:
+            raise BulkIndexError(f"[{sheet}] {len(failed)} document(s) failed to index", failed)
+    finally:
+        es_client.indices.put_settings(
+            index=es_index_name,
+            settings={"index": {
+                "refresh_interval": POST_IMPORT_REFRESH_INTERVAL,
+                "number_of_replicas": replicas,
+                "translog": {"durability": "request"},
+            }},
+        )
+    # Only merge and refresh after a successful load, so these calls can never mask a bulk error
+    es_client.indices.forcemerge(index=es_index_name, max_num_segments=1)
+    es_client.indices.refresh(index=es_index_name)
+    print(f"[{sheet}] Imported {imported}/{len(records)} records into Elasticsearch index '{es_index_name}'")
 
 # ----------------------------------- CLI ---------------------------------------
 
-def _parse_args(argv: List[str]) -> Tuple[str, Optional[str], Optional[str]]:
-    """Returns (excel_file, sheets_arg, single_out_sheet)."""
+def _parse_args(argv: List[str]) -> Tuple[str, Optional[str], Optional[str], bool]:
+    """Returns (excel_file, sheets_arg, single_out_sheet, write_files)."""
     if len(argv) < 2:
-        print("Usage: python read_and_index_with_resolving.py <excel_file> [sheet_name|A,B,C|ALL] [--single-out=SheetName]")
+        print("Usage: python read_and_index_with_resolving.py <excel_file> [sheet_name|A,B,C|ALL] [--single-out=SheetName] [--write-files]")
         sys.exit(1)
 
     excel_file = argv[1]
     sheets_arg: Optional[str] = None
     single_out_sheet: Optional[str] = None
+    write_files = WRITE_ONE_FILE_PER_ROW
 
     for arg in argv[2:]:
         if arg.startswith("--single-out="):
             single_out_sheet = arg.split("=", 1)[1].strip()
+        elif arg == "--write-files":
+            write_files = True
         elif sheets_arg is None:
             sheets_arg = arg.strip()
         else:
             # ignore extras; add more flags here if needed
             pass
 
-    return excel_file, sheets_arg, single_out_sheet
+    return excel_file, sheets_arg, single_out_sheet, write_files
 
 if __name__ == "__main__":
-    excel_file, sheet_arg, single_out = _parse_args(sys.argv)
+    excel_file, sheet_arg, single_out, write_files = _parse_args(sys.argv)
 
-    targets = _normalize_targets(excel_file, sheet_arg)
+    # Open the workbook once; every sheet read below reuses this handle
+    xls = pd.ExcelFile(excel_file, engine="calamine")
+    targets = _normalize_targets(xls, sheet_arg)
 
     total_written = 0
     combined_buffer: Dict[str, List[Dict[str, Any]]] = {}
 
-    # Process sheets strictly in order; each step enriches the in-memory stores
-    for sheet in targets:
-        written, cleaned = excel_sheet_to_json(
-            excel_path=excel_file,
-            main_sheet=sheet,
-            prefer_processed_refs=True,  # <-- prefer results from already processed sheets
-        )
-        total_written += written
-        combined_buffer[sheet] = cleaned
+    # Process sheets in dependency order, one at a time in this process; each step enriches
+    # the in-memory stores for the next. A processed sheet is handed to a background import
+    # right away, so indexing it overlaps with reading and resolving the next sheet.
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as importer:
+        imports = []
+        for sheet in _dependency_order(targets):
+            written, records = excel_sheet_to_json(
+                xls=xls,
+                main_sheet=sheet,
+                prefer_processed_refs=True,  # <-- prefer results from already processed sheets
+                write_files=write_files,
+            )
+            total_written += written
+            combined_buffer[sheet] = records
+            imports.append(importer.submit(import_index, sheet, es, records))
 
-    # Import ES for each processed sheet, honoring the same order
-    for sheet in targets:
-        import_index(sheet, es)
+        for future in imports:
+            future.result()
 
     # After *all* processing is complete, optionally write one combined file for a single sheet
     if single_out:
         if single_out not in combined_buffer:
             raise KeyError(f"--single-out '{single_out}' was not processed. Available: {list(combined_buffer.keys())}")
+        OUT_DIR.mkdir(parents=True, exist_ok=True)
         out_path = OUT_DIR / f"{single_out.lower()}.json"
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(combined_buffer[single_out], f, ensure_ascii=False, indent=2, allow_nan=False)
+        out_path.write_bytes(orjson.dumps(combined_buffer[single_out], default=_json_default, option=JSON_OPTIONS))
         print(f"[{single_out}] Wrote combined JSON file at the end: {out_path}")
 
     print(f"Done. Total JSON rows written across {len(targets)} sheet(s): {total_written}")